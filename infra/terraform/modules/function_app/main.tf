@@ -30,6 +30,7 @@ resource "azurerm_linux_function_app" "main" {
     "KEY_VAULT_URI"             = var.key_vault_uri
     "FUNCTIONS_WORKER_RUNTIME"  = "python"
     "AzureWebJobsFeatureFlags"  = "EnableWorkerIndexing"
+    "MODEL_RUNTIME"             = "treelite"
   }
 
   identity {
@@ -2,19 +2,37 @@
 Upload trained model to Azurite (local Azure Storage emulator)
 """
 
+import json
 import os
 from azure.storage.blob import BlobServiceClient
 
 # Azurite connection string
 connection_string = "DefaultEndpointsProtocol=http;AccountName=devstoreaccount1;AccountKey=Eby8vdM02xNOcqFlqUwJPLlmEtlCDXJ1OUzFT50uSRZ6IFsuFq2UVErCz4I6tq/K1SZFPTOtr/KBHBeksoGMGw==;BlobEndpoint=http://127.0.0.1:10000/devstoreaccount1;"
 
-# Model file path (from ml_pipeline)
-model_path = os.path.join(
-    os.path.dirname(__file__), "..", "src", "ml_pipeline", "models", "model.pkl"
-)
+# Model file paths (from ml_pipeline)
+models_dir = os.path.join(os.path.dirname(__file__), "..", "src", "ml_pipeline", "models")
+model_path = os.path.join(models_dir, "model.pkl")
+compiled_model_path = os.path.join(models_dir, "model.so")
+onnx_model_path = os.path.join(models_dir, "model.onnx")
+metrics_path = os.path.join(models_dir, "..", "logs", "metrics.json")
+
+# Fast path settings travel with the model blob (fast path stays off without them)
+metadata = {}
+if os.path.exists(metrics_path):
+    with open(metrics_path) as f:
+        metrics = json.load(f)
+    metadata = {
+        key: str(metrics[key])
+        for key in ("fast_path_margin", "fast_path_confidence")
+        if key in metrics
+    }
 
 print(f"Connecting to Azurite...")
-blob_service_client = BlobServiceClient.from_connection_string(connection_string)
+blob_service_client = BlobServiceClient.from_connection_string(
+    connection_string,
+    max_block_size=16 * 1024 * 1024,
+    max_single_put_size=64 * 1024 * 1024,
+)
 
 # Create container if it doesn't exist
 container_name = "models"
@@ -29,17 +47,29 @@ except Exception as e:
     else:
         raise
 
-# Upload model
-blob_name = "model_v1.pkl"
-print(f"Uploading {model_path} to {container_name}/{blob_name}...")
+# Upload compiled and ONNX models (if built), then the pickle
+uploads = [
+    ("model_v1.so", compiled_model_path),
+    ("model_v1.onnx", onnx_model_path),
+    ("model_v1.pkl", model_path),
+]
 
-blob_client = blob_service_client.get_blob_client(
-    container=container_name, blob=blob_name
-)
+for blob_name, path in uploads:
+    if not os.path.exists(path):
+        print(f"Skipping {path} (not found)")
+        continue
+
+    print(f"Uploading {path} to {container_name}/{blob_name}...")
+
+    blob_client = blob_service_client.get_blob_client(
+        container=container_name, blob=blob_name
+    )
 
-with open(model_path, "rb") as data:
-    blob_client.upload_blob(data, overwrite=True)
+    with open(path, "rb") as data:
+        blob_client.upload_blob(
+            data, overwrite=True, metadata=metadata, max_concurrency=8
+        )
 
-print(f"✅ Model uploaded successfully to Azurite!")
-print(f"   Container: {container_name}")
-print(f"   Blob: {blob_name}")
+    print(f"✅ Model uploaded successfully to Azurite!")
+    print(f"   Container: {container_name}")
+    print(f"   Blob: {blob_name}")
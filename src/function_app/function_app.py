@@ -1,14 +1,66 @@
 import azure.functions as func
+import asyncio
+import io
 import logging
-import json
 import os
+import threading
+import time
 from azure.storage.blob import BlobServiceClient
 from azure.identity import DefaultAzureCredential
 import joblib
 import numpy as np
+import orjson
 
 app = func.FunctionApp()
 
+# Dynamic batching settings for the predict endpoint
+MAX_BATCH_SIZE = int(os.environ.get('PREDICT_MAX_BATCH_SIZE', '32'))
+MAX_BATCH_LATENCY_MS = float(os.environ.get('PREDICT_MAX_BATCH_LATENCY_MS', '5'))
+
+# Blob transfer tuning for model downloads: fetch blobs up to 64 MB in a
+# single GET, larger ones as parallel 16 MB ranges
+BLOB_MAX_SINGLE_GET_SIZE = 64 * 1024 * 1024
+BLOB_MAX_CHUNK_GET_SIZE = 16 * 1024 * 1024
+BLOB_MAX_CONCURRENCY = 8
+
+# How long a loaded model is served before its blob ETag is checked again
+MODEL_REVALIDATE_SECONDS = float(os.environ.get('MODEL_REVALIDATE_SECONDS', '30'))
+
+# Largest feature magnitude the float32 model input can hold
+FLOAT32_MAX = float(np.finfo(np.float32).max)
+
+# Rows far from the decision boundary can be answered with the labelling rule
+# the model was trained on, skipping the model. The margin and confidence
+# ship as metadata on the model blob, so they always match the model served
+FAST_PATH_ENABLED = os.environ.get('FAST_PATH_ENABLED', '').strip().lower() in ('1', 'true', 'yes')
+
+# Model runtime: 'sklearn' loads the pickled estimator, 'treelite' loads the
+# forest compiled to a native library and 'onnx' runs the ONNX export with
+# ONNX Runtime; both artifacts are produced by the training pipeline
+MODEL_RUNTIME = os.environ.get('MODEL_RUNTIME', 'sklearn')
+MODEL_BLOBS = {
+    'sklearn': 'model_v1.pkl',
+    'treelite': 'model_v1.so',
+    'onnx': 'model_v1.onnx'
+}
+
+# Blob clients are created once per worker so the connection pool is reused
+# across model reloads; they stay unset when storage is not configured
+try:
+    _blob_service_client = BlobServiceClient.from_connection_string(
+        os.environ['STORAGE_CONNECTION_STRING'],
+        max_single_get_size=BLOB_MAX_SINGLE_GET_SIZE,
+        max_chunk_get_size=BLOB_MAX_CHUNK_GET_SIZE
+    )
+    _model_blob_client = _blob_service_client.get_blob_client(
+        container='models',
+        blob=MODEL_BLOBS[MODEL_RUNTIME]
+    )
+except Exception as e:
+    logging.warning(f'Blob storage client not configured: {str(e)}')
+    _blob_service_client = None
+    _model_blob_client = None
+
 
 @app.route(route="health", methods=["GET"], auth_level=func.AuthLevel.ANONYMOUS)
 def health_check(req: func.HttpRequest) -> func.HttpResponse:
@@ -16,7 +68,7 @@ def health_check(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('Health check endpoint called')
     
     return func.HttpResponse(
-        json.dumps({
+        orjson.dumps({
             "status": "healthy",
             "service": "FluxOps ML Pipeline",
             "version": "1.0.0"
@@ -27,7 +79,7 @@ def health_check(req: func.HttpRequest) -> func.HttpResponse:
 
 
 @app.route(route="predict", methods=["POST"], auth_level=func.AuthLevel.FUNCTION)
-def predict(req: func.HttpRequest) -> func.HttpResponse:
+async def predict(req: func.HttpRequest) -> func.HttpResponse:
     """ML model prediction endpoint"""
     logging.info('Prediction endpoint called')
     
@@ -38,40 +90,56 @@ def predict(req: func.HttpRequest) -> func.HttpResponse:
         
         if not features:
             return func.HttpResponse(
-                json.dumps({"error": "Missing 'features' in request body"}),
+                orjson.dumps({"error": "Missing 'features' in request body"}),
                 mimetype="application/json",
                 status_code=400
             )
         
         # Validate features
-        if len(features) != 10:
+        if not isinstance(features, list) or len(features) != 10:
+            return func.HttpResponse(
+                orjson.dumps({"error": "Expected 10 features"}),
+                mimetype="application/json",
+                status_code=400
+            )
+        
+        if not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in features):
             return func.HttpResponse(
-                json.dumps({"error": "Expected 10 features"}),
+                orjson.dumps({"error": "Features must be numbers"}),
                 mimetype="application/json",
                 status_code=400
             )
         
-        # Load model from blob storage
-        model = load_model_from_blob()
+        # NaN, infinities and anything float32 cannot hold are refused here,
+        # before they can reach the fast path or another client's batch
+        if not all(abs(v) <= FLOAT32_MAX for v in features):
+            return func.HttpResponse(
+                orjson.dumps({"error": "Features must be finite float32 values"}),
+                mimetype="application/json",
+                status_code=400
+            )
         
-        # Make prediction
-        X = np.array(features).reshape(1, -1)
-        prediction = model.predict(X)[0]
-        probability = model.predict_proba(X)[0]
+        # Answer clear-cut rows directly, queue the rest for the batch worker
+        fast_result = fast_path_prediction(features)
+        if fast_result is not None:
+            prediction, probability = fast_result
+        else:
+            prediction, probability = await submit_for_prediction(features)
         
+        # numpy scalars go straight to orjson, no Python casts needed
         result = {
-            "prediction": int(prediction),
+            "prediction": prediction,
             "probability": {
-                "class_0": float(probability[0]),
-                "class_1": float(probability[1])
+                "class_0": probability[0],
+                "class_1": probability[1]
             },
-            "confidence": float(max(probability))
+            "confidence": probability.max()
         }
         
         logging.info(f'Prediction result: {result}')
         
         return func.HttpResponse(
-            json.dumps(result),
+            orjson.dumps(result, option=orjson.OPT_SERIALIZE_NUMPY),
             mimetype="application/json",
             status_code=200
         )
@@ -79,14 +147,14 @@ def predict(req: func.HttpRequest) -> func.HttpResponse:
     except ValueError as e:
         logging.error(f'Value error: {str(e)}')
         return func.HttpResponse(
-            json.dumps({"error": f"Invalid input: {str(e)}"}),
+            orjson.dumps({"error": f"Invalid input: {str(e)}"}),
             mimetype="application/json",
             status_code=400
         )
     except Exception as e:
         logging.error(f'Error processing prediction: {str(e)}')
         return func.HttpResponse(
-            json.dumps({"error": "Internal server error"}),
+            orjson.dumps({"error": "Internal server error"}),
             mimetype="application/json",
             status_code=500
         )
@@ -104,15 +172,16 @@ def model_info(req: func.HttpRequest) -> func.HttpResponse:
         info = {
             "model_name": "Random Forest Classifier",
             "model_version": "v1",
+            "model_runtime": MODEL_RUNTIME,
             "storage_account": storage_account,
             "container": "models",
-            "blob_name": "model_v1.pkl",
+            "blob_name": MODEL_BLOBS[MODEL_RUNTIME],
             "features_required": 10,
             "classes": [0, 1]
         }
         
         return func.HttpResponse(
-            json.dumps(info),
+            orjson.dumps(info),
             mimetype="application/json",
             status_code=200
         )
@@ -120,72 +189,326 @@ def model_info(req: func.HttpRequest) -> func.HttpResponse:
     except Exception as e:
         logging.error(f'Error getting model info: {str(e)}')
         return func.HttpResponse(
-            json.dumps({"error": "Internal server error"}),
+            orjson.dumps({"error": "Internal server error"}),
             mimetype="application/json",
             status_code=500
         )
 
 
-@app.blob_trigger(arg_name="blob", path="models/model_v1.pkl",
+@app.blob_trigger(arg_name="blob", path="models/{name}",
                   connection="STORAGE_CONNECTION_STRING")
 def model_updated(blob: func.InputStream):
     """Triggered when model is updated in blob storage"""
     logging.info(f'Model blob updated: {blob.name}')
     logging.info(f'Blob size: {blob.length} bytes')
     
-    # Clear any cached models
-    global _cached_model
-    _cached_model = None
+    # The ETag check decides whether to reload; this only skips the wait
+    # for the next periodic revalidation
+    _model_state['checked_at'] = 0.0
     
-    logging.info('Model cache cleared, will reload on next prediction')
+    logging.info('Model cache marked stale, will revalidate on next prediction')
 
 
-# Cache for loaded model
-_cached_model = None
+def parse_fast_path_metadata(metadata):
+    """Read the fast path margin and confidence stored on the model blob"""
+    try:
+        margin = float(metadata['fast_path_margin'])
+        confidence = float(metadata['fast_path_confidence'])
+    except (KeyError, TypeError, ValueError):
+        return None
+    
+    # Anything unusable (including NaN) disables the fast path
+    if not (margin >= 0 and 0.5 <= confidence <= 1):
+        return None
+    
+    # Class probabilities reported by the fast path, indexed by predicted class
+    probabilities = (
+        np.array([confidence, 1 - confidence]),
+        np.array([1 - confidence, confidence])
+    )
+    return margin, probabilities
 
 
-def load_model_from_blob():
-    """Load model from Azure Blob Storage with caching"""
-    global _cached_model
+def fast_path_prediction(features):
+    """Predict from the labelling rule when the row is far from the boundary"""
+    fast_path = _model_state['fast_path']
+    if not FAST_PATH_ENABLED or fast_path is None:
+        return None
     
-    if _cached_model is not None:
-        logging.info('Using cached model')
-        return _cached_model
+    margin, probabilities = fast_path
     
-    try:
-        logging.info('Loading model from blob storage...')
-        
-        # Get connection string from environment
-        connection_string = os.environ.get('STORAGE_CONNECTION_STRING')
+    # Written so a NaN score (inf + -inf) also goes to the model
+    score = features[0] + features[1]
+    if not abs(score) > margin:
+        return None
+    
+    prediction = 1 if score > 0 else 0
+    return prediction, probabilities[prediction]
+
+
+# Request queue and background worker for dynamic batching
+_batch_queue = None
+_batch_worker = None
+
+# Input matrix reused for every batch; only the single worker task fills it,
+# and it waits for each batch to be scored before refilling
+_batch_buffer = np.empty((MAX_BATCH_SIZE, 10), dtype=np.float32)
+
+
+async def submit_for_prediction(features):
+    """Enqueue a single feature row and wait for the batched prediction"""
+    global _batch_queue, _batch_worker
+    
+    # A restarted worker picks up the same queue, so rows queued before it
+    # stopped are still scored
+    if _batch_queue is None:
+        _batch_queue = asyncio.Queue()
+    if _batch_worker is None or _batch_worker.done():
+        _batch_worker = asyncio.create_task(batch_prediction_worker(_batch_queue))
+    
+    future = asyncio.get_running_loop().create_future()
+    await _batch_queue.put((features, future))
+    return await future
+
+
+async def batch_prediction_worker(queue):
+    """Group queued rows into one matrix and score them with a single model call"""
+    loop = asyncio.get_running_loop()
+    
+    while True:
+        batch = [await queue.get()]
+        deadline = loop.time() + MAX_BATCH_LATENCY_MS / 1000
         
-        if not connection_string:
-            raise ValueError("STORAGE_CONNECTION_STRING not set")
+        # Collect more rows until the batch is full or the latency budget is spent
+        while len(batch) < MAX_BATCH_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
         
-        # Create blob service client
-        blob_service_client = BlobServiceClient.from_connection_string(connection_string)
+        # Whatever goes wrong with one batch is reported to its callers and
+        # must not stop the worker serving the next one
+        try:
+            await score_batch(loop, batch)
+        except Exception as e:
+            logging.error(f'Error scoring batch: {str(e)}')
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+
+async def score_batch(loop, batch):
+    """Fill the input buffer from a batch of requests and resolve their futures"""
+    # Copy rows straight into the preallocated float32 matrix, skipping
+    # requests that were cancelled while queued and rejecting non-numeric ones
+    futures = []
+    for features, future in batch:
+        if future.done():
+            continue
+        row = _batch_buffer[len(futures)]
+        try:
+            # Overflow to inf is caught by the finiteness check below
+            with np.errstate(over='ignore'):
+                row[:] = features
+        except (TypeError, ValueError, OverflowError) as e:
+            future.set_exception(ValueError(str(e)))
+            continue
         
-        # Get blob client
-        blob_client = blob_service_client.get_blob_client(
-            container='models',
-            blob='model_v1.pkl'
-        )
+        # A value float32 cannot hold would make the model reject the whole
+        # batch, so only the request that sent it is failed
+        if not np.isfinite(row).all():
+            future.set_exception(ValueError('Features must be finite float32 values'))
+            continue
+        futures.append(future)
+    
+    if not futures:
+        return
+    
+    X = _batch_buffer[:len(futures)]
+    
+    # Run the blocking load and inference off the event loop so new
+    # requests keep queueing for the next batch meanwhile
+    predictions, probabilities = await loop.run_in_executor(None, predict_batch, X)
+    
+    logging.info(f'Scored batch of {len(futures)} requests')
+    
+    for i, future in enumerate(futures):
+        if not future.done():
+            future.set_result((predictions[i], probabilities[i]))
+
+
+def predict_batch(X):
+    """Run the model once over a stacked batch of feature rows"""
+    model = load_model_from_blob()
+    
+    # Classes are 0 and 1, so the argmax column is the predicted label;
+    # calling predict as well would walk every tree a second time
+    probabilities = model.predict_proba(X)
+    return probabilities.argmax(axis=1), probabilities
+
+
+# Cache for loaded model, keyed by the ETag of the blob it was read from
+_model_state = {'model': None, 'etag': None, 'checked_at': 0.0, 'fast_path': None}
+_model_lock = threading.Lock()
+
+
+def load_model_from_blob():
+    """Load model from Azure Blob Storage with caching"""
+    if (_model_state['model'] is not None
+            and time.monotonic() - _model_state['checked_at'] < MODEL_REVALIDATE_SECONDS):
+        logging.info('Using cached model')
+        return _model_state['model']
+    
+    # Serialize revalidation and loads so concurrent callers never download
+    # the model twice or see a partially loaded one
+    with _model_lock:
+        if (_model_state['model'] is not None
+                and time.monotonic() - _model_state['checked_at'] < MODEL_REVALIDATE_SECONDS):
+            return _model_state['model']
         
-        # Download model to temp file
-        import tempfile
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pkl') as tmp_file:
-            download_stream = blob_client.download_blob()
-            tmp_file.write(download_stream.readall())
-            tmp_file_path = tmp_file.name
+        try:
+            if _model_blob_client is None:
+                raise ValueError("STORAGE_CONNECTION_STRING not set")
+            
+            # A HEAD request is enough to tell whether the blob changed
+            etag = _model_blob_client.get_blob_properties().etag
+            if _model_state['model'] is not None and _model_state['etag'] == etag:
+                _model_state['checked_at'] = time.monotonic()
+                return _model_state['model']
         
-        # Load model
-        _cached_model = joblib.load(tmp_file_path)
+        except Exception as e:
+            if _model_state['model'] is None:
+                logging.error(f'Failed to load model: {str(e)}')
+                raise
+            
+            # Keep serving the loaded model while storage is unreachable
+            logging.warning(f'Model revalidation failed, using cached model: {str(e)}')
+            _model_state['checked_at'] = time.monotonic()
+            return _model_state['model']
         
-        # Clean up temp file
+        try:
+            logging.info('Loading model from blob storage...')
+            
+            # Download model straight into memory; the ETag recorded is the
+            # one of the bytes actually read
+            stream = io.BytesIO()
+            download_stream = _model_blob_client.download_blob(
+                max_concurrency=BLOB_MAX_CONCURRENCY
+            )
+            download_stream.readinto(stream)
+            
+            if MODEL_RUNTIME == 'treelite':
+                model = load_compiled_model(stream.getbuffer())
+            elif MODEL_RUNTIME == 'onnx':
+                model = load_onnx_model(stream.getvalue())
+            else:
+                stream.seek(0)
+                model = joblib.load(stream)
+            
+            # Score one float32 row so lazy runtime setup and page-ins happen
+            # here rather than in the first batch
+            model.predict_proba(np.zeros((1, 10), dtype=np.float32))
+            
+            # Publish only the fully loaded model to other threads
+            _model_state.update(
+                fast_path=parse_fast_path_metadata(download_stream.properties.metadata or {}),
+                model=model,
+                etag=download_stream.properties.etag,
+                checked_at=time.monotonic()
+            )
+            
+            logging.info(f'Model loaded successfully ({MODEL_RUNTIME} runtime)')
+            return model
+            
+        except Exception as e:
+            if _model_state['model'] is None:
+                logging.error(f'Failed to load model: {str(e)}')
+                raise
+            
+            # A bad upload must not take down a working model; retry after
+            # the next revalidation interval rather than on every batch
+            logging.error(f'Failed to load updated model, using cached model: {str(e)}')
+            _model_state['checked_at'] = time.monotonic()
+            return _model_state['model']
+
+
+class CompiledForest:
+    """Treelite-compiled forest exposing the sklearn predict API"""
+    
+    def __init__(self, predictor, dmatrix):
+        self.predictor = predictor
+        self.dmatrix = dmatrix
+    
+    def predict_proba(self, X):
+        dmat = self.dmatrix(np.asarray(X, dtype=np.float32))
+        return self.predictor.predict(dmat).reshape(len(X), -1)
+    
+    def predict(self, X):
+        return self.predict_proba(X).argmax(axis=1)
+
+
+def load_compiled_model(data):
+    """Load the Treelite shared library from the downloaded blob bytes"""
+    import tempfile
+    import tl2cgen
+    
+    # The predictor dlopens a path, so stage the library on tmpfs where
+    # available to keep disk writes off the cold-start path
+    tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+    with tempfile.NamedTemporaryFile(delete=False, suffix='.so', dir=tmp_dir) as tmp_file:
+        tmp_file.write(data)
+        tmp_file_path = tmp_file.name
+    
+    try:
+        predictor = tl2cgen.Predictor(tmp_file_path)
+    finally:
+        # The library stays mapped once loaded, so the file can go right away
         os.unlink(tmp_file_path)
-        
-        logging.info('Model loaded successfully')
-        return _cached_model
-        
-    except Exception as e:
-        logging.error(f'Failed to load model: {str(e)}')
-        raise
+    
+    return CompiledForest(predictor, tl2cgen.DMatrix)
+
+
+class OnnxForest:
+    """ONNX Runtime session exposing the sklearn predict API"""
+    
+    def __init__(self, session):
+        self.session = session
+        self.input_name = session.get_inputs()[0].name
+    
+    def predict_proba(self, X):
+        # The export disables zipmap, so probabilities come back as a tensor
+        inputs = {self.input_name: np.asarray(X, dtype=np.float32)}
+        return self.session.run(['probabilities'], inputs)[0]
+    
+    def predict(self, X):
+        return self.predict_proba(X).argmax(axis=1)
+
+
+def load_onnx_model(data):
+    """Create an ONNX Runtime session from the downloaded blob bytes"""
+    import onnxruntime
+    
+    # Requests are latency-bound and already batched, so one thread per
+    # operator avoids thread-pool wake-up overhead
+    session_options = onnxruntime.SessionOptions()
+    session_options.intra_op_num_threads = 1
+    
+    # Sessions load straight from bytes, no temp file needed
+    session = onnxruntime.InferenceSession(
+        data,
+        session_options,
+        providers=['CPUExecutionProvider']
+    )
+    
+    return OnnxForest(session)
+
+
+# Warm the model cache while the worker starts so the first request does not
+# pay for the blob download and deserialization
+try:
+    load_model_from_blob()
+except Exception as e:
+    logging.warning(f'Model preload skipped, will load on first prediction: {str(e)}')
@@ -0,0 +1,162 @@
+"""
+Unit tests for the prediction function's batching and fast path
+"""
+import asyncio
+
+import pytest
+import numpy as np
+
+func = pytest.importorskip('azure.functions')
+
+import orjson
+import function_app
+
+
+FEATURES_INSIDE = [0.5, 0.4] + [0.0] * 8
+FEATURES_POSITIVE = [2.0, 0.5] + [0.0] * 8
+FEATURES_NEGATIVE = [-1.0, -1.5] + [0.0] * 8
+
+
+@pytest.fixture
+def fast_path(monkeypatch):
+    """Enable the fast path with a margin of 1.5 and confidence of 0.9"""
+    state = function_app.parse_fast_path_metadata(
+        {'fast_path_margin': '1.5', 'fast_path_confidence': '0.9'}
+    )
+    monkeypatch.setattr(function_app, 'FAST_PATH_ENABLED', True)
+    monkeypatch.setitem(function_app._model_state, 'fast_path', state)
+    return state
+
+
+class RuleModel:
+    """Stand-in model that, like sklearn, refuses non-finite input"""
+    
+    def predict_proba(self, X):
+        if not np.isfinite(X).all():
+            raise ValueError('Input X contains infinity or a value too large')
+        positive = (X[:, 0] + X[:, 1] > 0).astype(np.float64)
+        return np.column_stack([1 - positive, positive])
+
+
+@pytest.fixture
+def batching(monkeypatch):
+    """Score batches with RuleModel on a fresh queue and worker"""
+    monkeypatch.setattr(function_app, 'load_model_from_blob', RuleModel)
+    monkeypatch.setattr(function_app, 'FAST_PATH_ENABLED', False)
+    monkeypatch.setattr(function_app, '_batch_queue', None)
+    monkeypatch.setattr(function_app, '_batch_worker', None)
+
+
+def predict_request(body):
+    """Build a POST request for the predict endpoint"""
+    return func.HttpRequest(method='POST', url='/api/predict', body=body)
+
+
+async def gather_predictions(rows):
+    """Submit rows concurrently so they land in the same batch"""
+    return await asyncio.gather(
+        *(function_app.submit_for_prediction(row) for row in rows),
+        return_exceptions=True
+    )
+
+
+@pytest.mark.parametrize('bad_value', [1e39, 10 ** 400])
+def test_bad_row_only_fails_its_own_request(batching, bad_value):
+    """Test a row float32 cannot hold does not fail the rest of its batch"""
+    rows = [FEATURES_POSITIVE, FEATURES_NEGATIVE, [bad_value] + [0.0] * 9, FEATURES_INSIDE]
+    
+    results = asyncio.run(gather_predictions(rows))
+    
+    assert isinstance(results[2], ValueError)
+    assert [results[i][0] for i in (0, 1, 3)] == [1, 0, 1]
+
+
+def test_predict_batch_with_bad_request(batching):
+    """Test valid requests batched with a bad one still return 200"""
+    handler = function_app.predict.build().get_user_function()
+    bodies = [orjson.dumps({'features': [0.1] * 10})] * 5
+    bodies.append(orjson.dumps({'features': [1e39] + [0.1] * 9}))
+    
+    async def send_all():
+        return await asyncio.gather(*(handler(predict_request(body)) for body in bodies))
+    
+    responses = asyncio.run(send_all())
+    
+    assert [response.status_code for response in responses] == [200] * 5 + [400]
+    assert orjson.loads(responses[0].get_body())['prediction'] == 1
+
+
+@pytest.mark.parametrize('value', [b'NaN', b'Infinity', b'-Infinity', b'1e39', b'1' + b'0' * 400])
+def test_predict_rejects_values_float32_cannot_hold(batching, monkeypatch, value):
+    """Test non-finite and out of range features are refused before queueing"""
+    async def fail_submit(features):
+        raise AssertionError('request was queued')
+    
+    monkeypatch.setattr(function_app, 'submit_for_prediction', fail_submit)
+    handler = function_app.predict.build().get_user_function()
+    body = b'{"features": [' + value + b', 0, 0, 0, 0, 0, 0, 0, 0, 0]}'
+    
+    response = asyncio.run(handler(predict_request(body)))
+    
+    assert response.status_code == 400
+    assert b'finite float32' in response.get_body()
+
+
+def test_parse_fast_path_metadata():
+    """Test margin and per-class probabilities read from blob metadata"""
+    margin, probabilities = function_app.parse_fast_path_metadata(
+        {'fast_path_margin': '1.5', 'fast_path_confidence': '0.9'}
+    )
+    
+    assert margin == 1.5
+    assert probabilities[0] == pytest.approx([0.9, 0.1])
+    assert probabilities[1] == pytest.approx([0.1, 0.9])
+
+
+@pytest.mark.parametrize('metadata', [
+    {},
+    {'fast_path_margin': '1.5'},
+    {'fast_path_margin': 'wide', 'fast_path_confidence': '0.9'},
+    {'fast_path_margin': 'nan', 'fast_path_confidence': '0.9'},
+    {'fast_path_margin': '-1', 'fast_path_confidence': '0.9'},
+    {'fast_path_margin': '1.5', 'fast_path_confidence': '0.3'},
+    {'fast_path_margin': '1.5', 'fast_path_confidence': '1.2'},
+])
+def test_parse_fast_path_metadata_invalid(metadata):
+    """Test missing or unusable metadata disables the fast path"""
+    assert function_app.parse_fast_path_metadata(metadata) is None
+
+
+def test_fast_path_disabled(fast_path, monkeypatch):
+    """Test rows go to the model when the fast path is switched off"""
+    monkeypatch.setattr(function_app, 'FAST_PATH_ENABLED', False)
+    
+    assert function_app.fast_path_prediction(FEATURES_POSITIVE) is None
+
+
+def test_fast_path_without_metadata(fast_path, monkeypatch):
+    """Test rows go to the model when the blob carried no fast path metadata"""
+    monkeypatch.setitem(function_app._model_state, 'fast_path', None)
+    
+    assert function_app.fast_path_prediction(FEATURES_POSITIVE) is None
+
+
+@pytest.mark.parametrize('features', [
+    FEATURES_INSIDE,
+    [float('nan'), 2.0] + [0.0] * 8,
+    [float('inf'), float('-inf')] + [0.0] * 8,
+])
+def test_fast_path_inside_margin(fast_path, features):
+    """Test rows near the boundary, or with no usable score, go to the model"""
+    assert function_app.fast_path_prediction(features) is None
+
+
+def test_fast_path_outside_margin(fast_path):
+    """Test rows beyond the margin are answered with the margin's confidence"""
+    prediction, probability = function_app.fast_path_prediction(FEATURES_POSITIVE)
+    assert prediction == 1
+    assert probability == pytest.approx([0.1, 0.9])
+    
+    prediction, probability = function_app.fast_path_prediction(FEATURES_NEGATIVE)
+    assert prediction == 0
+    assert probability == pytest.approx([0.9, 0.1])
@@ -4,6 +4,7 @@ Model inference utilities for making predictions
 import joblib
 import numpy as np
 import logging
+import warnings
 
 logger = logging.getLogger(__name__)
 
@@ -30,23 +31,38 @@ class ModelInference:
         if self.model is None:
             raise ValueError("Model not loaded")
         
-        predictions = self.model.predict(X)
+        # sklearn's trees run on C-contiguous float32; converting once here
+        # avoids a hidden copy inside predict_proba
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        
+        # Derive labels from the probabilities instead of traversing the
+        # forest again with predict
         probabilities = self.model.predict_proba(X)
+        predictions = self.model.classes_.take(probabilities.argmax(axis=1))
         
         return {
             'predictions': predictions.tolist(),
             'probabilities': probabilities.tolist()
         }
     
-    def predict_single(self, features):
-        """Predict for a single sample"""
-        X = np.array(features).reshape(1, -1)
+    def predict_many(self, feature_vectors):
+        """Predict for a list of samples with a single model call"""
+        X = np.asarray(feature_vectors, dtype=np.float32)
         result = self.predict(X)
         
-        return {
-            'prediction': result['predictions'][0],
-            'probability': result['probabilities'][0]
-        }
+        return [
+            {'prediction': prediction, 'probability': probability}
+            for prediction, probability in zip(result['predictions'], result['probabilities'])
+        ]
+    
+    def predict_single(self, features):
+        """Predict for a single sample (deprecated, use predict_many)"""
+        warnings.warn(
+            "predict_single is deprecated; batch samples with predict_many",
+            DeprecationWarning,
+            stacklevel=2
+        )
+        return self.predict_many([features])[0]
 
 
 if __name__ == '__main__':
@@ -54,6 +70,7 @@ if __name__ == '__main__':
     inference = ModelInference('models/model.pkl')
     
     # Test prediction
-    sample_features = np.random.randn(10).tolist()
-    result = inference.predict_single(sample_features)
-    print(f"Prediction: {result}")
+    rng = np.random.default_rng()
+    samples = rng.standard_normal((5, 10), dtype=np.float32).tolist()
+    for result in inference.predict_many(samples):
+        print(f"Prediction: {result}")
@@ -7,13 +7,15 @@ import pandas as pd
 from train_model import MLPipeline
 from inference import ModelInference
 import os
+import json
 import tempfile
 import shutil
+from collections import namedtuple
 
 
-@pytest.fixture
+@pytest.fixture(scope='session')
 def temp_dirs():
-    """Create temporary directories for testing"""
+    """Create temporary directories shared by the test session"""
     model_dir = tempfile.mkdtemp()
     log_dir = tempfile.mkdtemp()
     
@@ -31,6 +33,50 @@ def pipeline(temp_dirs):
     return MLPipeline(model_dir=model_dir, log_dir=log_dir)
 
 
+@pytest.fixture(scope='session')
+def trained_pipeline(temp_dirs):
+    """Pipeline with a small forest trained once for the whole session"""
+    model_dir, log_dir = temp_dirs
+    pipeline = MLPipeline(model_dir=model_dir, log_dir=log_dir)
+    
+    X, y = pipeline.generate_sample_arrays(n_samples=100)
+    pipeline.train_model(X, y, n_estimators=10, max_depth=5)
+    
+    return pipeline
+
+
+TrainedState = namedtuple(
+    'TrainedState', ['pipeline', 'X', 'y', 'metrics', 'model_path', 'metrics_path']
+)
+
+
+@pytest.fixture(scope='session')
+def trained_state(trained_pipeline, tmp_path_factory):
+    """Evaluate and save the session's model once, in directories of its own"""
+    model_dir = tmp_path_factory.mktemp('models')
+    log_dir = tmp_path_factory.mktemp('logs')
+    pipeline = MLPipeline(model_dir=str(model_dir), log_dir=str(log_dir))
+    pipeline.model = trained_pipeline.model
+    
+    X, y = pipeline.generate_sample_arrays(n_samples=100)
+    metrics = pipeline.evaluate_model(X, y)
+    model_path = pipeline.save_model()
+    metrics_path = pipeline.save_metrics()
+    
+    return TrainedState(pipeline, X, y, metrics, model_path, metrics_path)
+
+
+def test_generate_sample_arrays(pipeline):
+    """Test array data generation"""
+    X, y = pipeline.generate_sample_arrays(n_samples=100)
+    
+    assert X.shape == (100, 10)
+    assert X.dtype == np.float32
+    assert y.shape == (100,)
+    assert y.dtype == np.int8
+    assert np.unique(y).tolist() == [0, 1]
+
+
 def test_generate_sample_data(pipeline):
     """Test data generation"""
     df = pipeline.generate_sample_data(n_samples=100)
@@ -41,107 +87,167 @@ def test_generate_sample_data(pipeline):
     assert df['target'].nunique() == 2
 
 
+def test_generate_sample_dataframe(pipeline):
+    """Test DataFrame data generation matches the arrays"""
+    df = pipeline.generate_sample_dataframe(n_samples=100)
+    X, y = pipeline.generate_sample_arrays(n_samples=100)
+    
+    assert isinstance(df, pd.DataFrame)
+    assert df.drop(columns='target').to_numpy() == pytest.approx(X)
+    assert df['target'].tolist() == y.tolist()
+    
+    assert df.shape[0] == 100
+    assert df.shape[1] == 11  # 10 features + 1 target
+    assert 'target' in df.columns
+    assert df['target'].nunique() == 2
+
+
 def test_train_model(pipeline):
     """Test model training"""
-    df = pipeline.generate_sample_data(n_samples=100)
-    X_train = df.drop('target', axis=1)
-    y_train = df['target']
+    X_train, y_train = pipeline.generate_sample_arrays(n_samples=100)
     
-    model = pipeline.train_model(X_train, y_train)
+    model = pipeline.train_model(X_train, y_train, n_estimators=5)
     
     assert model is not None
     assert hasattr(model, 'predict')
     assert hasattr(model, 'predict_proba')
 
 
-def test_evaluate_model(pipeline):
+def test_evaluate_model(trained_state):
     """Test model evaluation"""
-    df = pipeline.generate_sample_data(n_samples=100)
-    X = df.drop('target', axis=1)
-    y = df['target']
-    
-    pipeline.train_model(X, y)
-    metrics = pipeline.evaluate_model(X, y)
+    metrics = trained_state.metrics
     
     assert 'accuracy' in metrics
     assert 0 <= metrics['accuracy'] <= 1
     assert 'classification_report' in metrics
     assert 'confusion_matrix' in metrics
+    assert np.sum(metrics['confusion_matrix']) == len(trained_state.y)
 
 
-def test_save_model(pipeline):
-    """Test model saving"""
-    df = pipeline.generate_sample_data(n_samples=100)
-    X = df.drop('target', axis=1)
-    y = df['target']
+class FixedProbabilityModel:
+    """Stand-in classifier returning preset class probabilities"""
+    classes_ = np.array([0, 1])
     
-    pipeline.train_model(X, y)
-    model_path = pipeline.save_model()
+    def __init__(self, positive):
+        self.probabilities = np.column_stack([1 - np.asarray(positive), positive])
+    
+    def predict_proba(self, X):
+        return self.probabilities
+
+
+def test_compute_fast_path_margin(pipeline):
+    """Test the margin covers every unsafe row and the confidence beyond it"""
+    X = np.zeros((6, 10), dtype=np.float32)
+    X[:, 0] = [-3, -2, -1, 1, 2, 3]
     
-    assert os.path.exists(model_path)
-    assert model_path.endswith('.pkl')
+    # score -1 is right but unsure, score 1 is wrong: the margin must be 1
+    pipeline.model = FixedProbabilityModel([0.02, 0.05, 0.4, 0.3, 0.92, 0.97])
+    margin = pipeline.compute_fast_path_margin(X)
+    
+    assert margin == 1.0
+    assert pipeline.metrics['fast_path_margin'] == 1.0
+    assert pipeline.metrics['fast_path_confidence'] == pytest.approx(0.92)
+
+
+def test_save_model(trained_state):
+    """Test model saving"""
+    assert os.path.exists(trained_state.model_path)
+    assert trained_state.model_path.endswith('.pkl')
 
 
-def test_save_metrics(pipeline):
+def test_save_metrics(trained_state):
     """Test metrics saving"""
-    df = pipeline.generate_sample_data(n_samples=100)
-    X = df.drop('target', axis=1)
-    y = df['target']
+    assert os.path.exists(trained_state.metrics_path)
+    assert trained_state.metrics_path.endswith('.json')
     
-    pipeline.train_model(X, y)
-    pipeline.evaluate_model(X, y)
-    metrics_path = pipeline.save_metrics()
+    with open(trained_state.metrics_path) as f:
+        assert json.load(f)['accuracy'] == trained_state.metrics['accuracy']
+
+
+def test_compile_model(trained_pipeline):
+    """Test compiled model matches sklearn probabilities"""
+    tl2cgen = pytest.importorskip('tl2cgen')
+    
+    X, y = trained_pipeline.generate_sample_arrays(n_samples=100)
+    lib_path = trained_pipeline.compile_model()
+    
+    assert os.path.exists(lib_path)
+    
+    predictor = tl2cgen.Predictor(lib_path)
+    probabilities = predictor.predict(tl2cgen.DMatrix(X)).reshape(len(X), -1)
+    
+    assert probabilities == pytest.approx(trained_pipeline.model.predict_proba(X), abs=1e-5)
+
+
+def test_export_onnx(trained_pipeline):
+    """Test ONNX model matches sklearn probabilities"""
+    ort = pytest.importorskip('onnxruntime')
+    
+    X, y = trained_pipeline.generate_sample_arrays(n_samples=100)
+    onnx_path = trained_pipeline.export_onnx()
+    
+    assert os.path.exists(onnx_path)
     
-    assert os.path.exists(metrics_path)
-    assert metrics_path.endswith('.json')
+    session = ort.InferenceSession(onnx_path, providers=['CPUExecutionProvider'])
+    labels, probabilities = session.run(None, {'input': X})
+    
+    assert probabilities == pytest.approx(trained_pipeline.model.predict_proba(X), abs=1e-5)
+    assert labels.tolist() == trained_pipeline.model.predict(X).tolist()
 
 
 def test_full_pipeline(pipeline):
     """Test complete pipeline execution"""
-    results = pipeline.run()
+    results = pipeline.run(n_estimators=10, max_depth=5)
     
     assert 'model_path' in results
     assert 'metrics_path' in results
     assert 'metrics' in results
+    assert 'fast_path_margin' in results['metrics']
     assert os.path.exists(results['model_path'])
+    assert os.path.exists(results['compiled_model_path'])
+    assert os.path.exists(results['onnx_model_path'])
     assert os.path.exists(results['metrics_path'])
 
 
-def test_inference(pipeline):
+def test_inference(trained_pipeline):
     """Test model inference"""
-    # Train and save model
-    df = pipeline.generate_sample_data(n_samples=100)
-    X = df.drop('target', axis=1)
-    y = df['target']
-    
-    pipeline.train_model(X, y)
-    model_path = pipeline.save_model()
+    model_path = trained_pipeline.save_model()
     
     # Load and predict
     inference = ModelInference(model_path)
-    sample_features = np.random.randn(10).tolist()
-    result = inference.predict_single(sample_features)
+    rng = np.random.default_rng(0)
+    samples = rng.standard_normal((5, 10), dtype=np.float32).tolist()
+    results = inference.predict_many(samples)
     
-    assert 'prediction' in result
-    assert 'probability' in result
-    assert result['prediction'] in [0, 1]
-    assert len(result['probability']) == 2
-    assert sum(result['probability']) == pytest.approx(1.0)
+    assert len(results) == 5
+    for result in results:
+        assert 'prediction' in result
+        assert 'probability' in result
+        assert result['prediction'] in [0, 1]
+        assert len(result['probability']) == 2
+        assert sum(result['probability']) == pytest.approx(1.0)
 
 
-def test_inference_batch(pipeline):
-    """Test batch inference"""
-    # Train and save model
-    df = pipeline.generate_sample_data(n_samples=100)
-    X = df.drop('target', axis=1)
-    y = df['target']
+def test_inference_single_deprecated(trained_pipeline):
+    """Test single-sample inference still works but warns"""
+    X, y = trained_pipeline.generate_sample_arrays(n_samples=100)
+    model_path = trained_pipeline.save_model()
     
-    pipeline.train_model(X, y)
-    model_path = pipeline.save_model()
+    inference = ModelInference(model_path)
+    with pytest.deprecated_call():
+        result = inference.predict_single(X[0].tolist())
+    
+    assert result == inference.predict_many([X[0]])[0]
+
+
+def test_inference_batch(trained_pipeline):
+    """Test batch inference"""
+    model_path = trained_pipeline.save_model()
     
     # Batch prediction
     inference = ModelInference(model_path)
-    X_test = np.random.randn(5, 10)
+    rng = np.random.default_rng(0)
+    X_test = rng.standard_normal((5, 10), dtype=np.float32)
     result = inference.predict(X_test)
     
     assert 'predictions' in result